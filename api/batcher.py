@@ -0,0 +1,112 @@
+"""
+Micro-batching for model inference.
+Groups concurrently submitted requests into a single batched model call.
+"""
+
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import Executor
+from typing import Any
+
+
+class MicroBatcher:
+    """
+    Collects items submitted by concurrent requests and processes them in batches.
+
+    The first queued item opens a batch window; items arriving within the window
+    (up to max_batch_size) are processed together by one call to process_batch,
+    which runs in the given executor (the loop's default thread pool if None)
+    and must return one result per item, in order. A failed batch is retried
+    item by item, so one bad item doesn't fail the others.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[list[Any]], list[Any]],
+        max_batch_size: int = 8,
+        window_ms: float = 10.0,
+        executor: Executor | None = None,
+    ):
+        self.process_batch = process_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        # Queue and worker of the loop in use, started lazily on first submit and
+        # replaced when a different loop submits (e.g. TestClient without `with`)
+        self._worker: tuple[asyncio.AbstractEventLoop, asyncio.Queue, asyncio.Task] | None = None
+
+    async def submit(self, item: Any) -> Any:
+        """Queue an item for the next batch and wait for its result."""
+        loop = asyncio.get_running_loop()
+        queue = self._get_queue(loop)
+
+        future = loop.create_future()
+        await queue.put((item, future))
+        return await future
+
+    def _get_queue(self, loop: asyncio.AbstractEventLoop) -> asyncio.Queue:
+        """Return the loop's queue, (re)starting its worker if needed."""
+        if self._worker is not None:
+            worker_loop, queue, worker = self._worker
+            if worker_loop is loop and not worker.done():
+                return queue
+
+        queue = asyncio.Queue()
+        self._worker = (loop, queue, loop.create_task(self._run(queue)))
+        return queue
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        """Worker loop: collect a batch, process it, repeat."""
+        while True:
+            batch = await self._collect_batch(queue)
+            await self._process(batch)
+
+    async def _collect_batch(self, queue: asyncio.Queue) -> list[tuple[Any, asyncio.Future]]:
+        """Wait for the first item, then gather more until the window closes or the batch is full."""
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        deadline = loop.time() + self.window
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            try:
+                if remaining > 0:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                else:
+                    batch.append(queue.get_nowait())
+            except (TimeoutError, asyncio.QueueEmpty):
+                break
+
+        return batch
+
+    async def _process(self, batch: list[tuple[Any, asyncio.Future]]) -> None:
+        """
+        Run process_batch in the executor and resolve each item's future.
+
+        If a batch of several items fails, its items are retried one at a time so
+        the error only reaches the request that caused it.
+        """
+        try:
+            results = await self._run_batch([item for item, _ in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                for entry in batch:
+                    await self._process([entry])
+                return
+            # Skip requests that were cancelled (e.g. client disconnected)
+            _, future = batch[0]
+            if not future.done():
+                future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results, strict=True):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run_batch(self, items: list[Any]) -> list[Any]:
+        """Call process_batch in the executor and check it returned one result per item."""
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, self.process_batch, items)
+        if len(results) != len(items):
+            raise RuntimeError(f"Expected {len(items)} batch results, got {len(results)}")
+        return results
@@ -3,16 +3,32 @@ from pathlib import Path
 
 # API configuration
 API_PORT = int(os.getenv("API_PORT", "8000"))
+# Worker processes, each with its own model; uvicorn reads the same variable for --workers
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
 
 # UI configuration
 UI_PORT = int(os.getenv("UI_PORT", "8501"))
 
 # Model configuration
 # Defaults to relative path which works for both Docker (/app/models) and local (./models)
+# Point at a TensorRT .engine (see scripts/export_engine.sh) for faster GPU inference
 MODEL_PATH = os.getenv("MODEL_PATH", "models/yolov8n.pt")
 
+# Dummy inferences run at startup so the first request doesn't pay model setup cost
+WARMUP_RUNS = int(os.getenv("WARMUP_RUNS", "2"))
+
 # Detection configuration
 CONFIDENCE_THRESHOLD_DEFAULT = float(os.getenv("CONFIDENCE_THRESHOLD_DEFAULT", "0.25"))
 
+# Batching configuration
+# Concurrent requests arriving within the window share one model call
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "10"))
+
+# Annotated image configuration
+# Images requested with return_annotated are kept in memory for this long
+ANNOTATED_TTL_SECONDS = float(os.getenv("ANNOTATED_TTL_SECONDS", "60"))
+ANNOTATED_MAX_ENTRIES = int(os.getenv("ANNOTATED_MAX_ENTRIES", "256"))
+
 # Output configuration
 OUTPUT_DIR = Path(os.getenv("OUTPUT_DIR", "output"))
@@ -3,91 +3,210 @@ Object detection service using YOLOv8.
 Handles model inference, result processing, and image annotation.
 """
 
-import base64
-from collections import Counter
-from io import BytesIO
+import logging
 from pathlib import Path
 
-import cv2
 import numpy as np
-from PIL import Image
+import simplejpeg
+import torch
 from ultralytics import YOLO
 from ultralytics.engine.results import Boxes, Results
 
 # Support both package imports (for testing) and direct imports (for Docker)
 try:
+    from .image_store import AnnotatedImageStore, ImageStore
     from .models import Detection, DetectionResponse
+    from .predictor import DevicePreprocessPredictor
 except ImportError:
+    from image_store import AnnotatedImageStore, ImageStore
+    from predictor import DevicePreprocessPredictor
+
     from models import Detection, DetectionResponse
 
+logger = logging.getLogger(__name__)
+
 
 class DetectorService:
     """Service for performing object detection with YOLOv8."""
 
-    def __init__(self, model_path: str, output_dir: Path):
-        self.model = YOLO(model_path)
+    def __init__(
+        self,
+        model_path: str,
+        output_dir: Path,
+        warmup_runs: int = 2,
+        image_store: ImageStore | None = None,
+    ):
+        # Task is explicit because exported formats (.engine, .onnx) can't always infer it
+        self.model = YOLO(model_path, task="detect")
+        # FP16 halves GPU compute and memory traffic; CPU kernels stay in FP32
+        self.half = torch.cuda.is_available()
+        # Class names indexed by class id; tuple indexing beats the model.names dict lookup
+        self._names = tuple(self.model.names[i] for i in range(len(self.model.names)))
         self.output_dir = output_dir
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        # Annotated images returned to clients are served from here by URL
+        self.image_store = image_store if image_store is not None else AnnotatedImageStore()
+        self._warmup(warmup_runs)
+
+    def _warmup(self, runs: int) -> None:
+        """
+        Run dummy inferences so the first real request hits a ready model.
+
+        The first call sets up the predictor (device placement, fusing layers,
+        CUDA context on GPU), which is much slower than a steady-state inference.
+        """
+        dummy = np.zeros((640, 640, 3), dtype=np.uint8)
+        for _ in range(runs):
+            try:
+                self._predict(dummy, conf=0.25, verbose=False)
+            except Exception:
+                logger.warning("Model warm-up failed, first request will be slower", exc_info=True)
+                return
 
     def detect(
-        self, image: Image.Image, confidence_threshold: float = 0.25, save_annotated: bool = True
+        self,
+        image: np.ndarray,
+        confidence_threshold: float = 0.25,
+        save_annotated: bool = True,
+        return_annotated: bool = False,
+        imgsz: int = 640,
+        output_dir: Path | None = None,
     ) -> DetectionResponse:
-        """Perform object detection on an image."""
-        img_array = np.array(image)
-
-        # Perform inference
-        results: list[Results] = self.model(img_array, conf=confidence_threshold)
-        result: Results = results[0]
+        """Perform object detection on a BGR image array."""
+        return self.detect_batch(
+            [image],
+            [confidence_threshold],
+            save_annotated,
+            [return_annotated],
+            imgsz,
+            None if output_dir is None else [output_dir],
+        )[0]
+
+    def detect_batch(
+        self,
+        images: list[np.ndarray],
+        confidence_thresholds: list[float],
+        save_annotated: bool = True,
+        return_annotated: list[bool] | None = None,
+        imgsz: int = 640,
+        output_dirs: list[Path] | None = None,
+        inline_annotated: list[bool] | None = None,
+    ) -> list[DetectionResponse]:
+        """Perform object detection on several images with a single model call."""
+        # Per-image flags: store the annotated image and link it in the response
+        if return_annotated is None:
+            return_annotated = [False] * len(images)
+        # Directory each image's annotated file is saved to
+        if output_dirs is None:
+            output_dirs = [self.output_dir] * len(images)
+        # Per-image flags: attach the annotated JPEG to the response instead of storing it
+        if inline_annotated is None:
+            inline_annotated = [False] * len(images)
+
+        # The model runs at the lowest threshold; each result is filtered to its own below
+        min_confidence = min(confidence_thresholds)
+
+        # Perform inference (imgsz is a multiple of 32, shared by all images)
+        results = self._predict(images, conf=min_confidence, imgsz=imgsz)
+
+        # Every image saved to a directory overwrites the same file, so only the last
+        # one per directory is saved (and drawn, unless returned too)
+        last_for_dir = {output_dir: i for i, output_dir in enumerate(output_dirs)}
+
+        responses = []
+        for i, (result, confidence_threshold, include_annotated, output_dir, inline) in enumerate(
+            zip(
+                results,
+                confidence_thresholds,
+                return_annotated,
+                output_dirs,
+                inline_annotated,
+                strict=True,
+            )
+        ):
+            if confidence_threshold > min_confidence:
+                result = result[result.boxes.conf >= confidence_threshold]
+            save = save_annotated and last_for_dir[output_dir] == i
+            responses.append(
+                self._build_response(result, save, include_annotated, output_dir, inline)
+            )
 
+        return responses
+
+    def _predict(self, source: np.ndarray | list[np.ndarray], **kwargs) -> list[Results]:
+        """
+        Run the model with the service's predictor settings.
+
+        Warm-up and real requests must pass the same settings so the predictor
+        is set up once and then reused. Preprocessing runs on the GPU when
+        available.
+        """
+        with torch.inference_mode():
+            return self.model(source, half=self.half, predictor=DevicePreprocessPredictor, **kwargs)
+
+    def _build_response(
+        self,
+        result: Results,
+        save_annotated: bool,
+        return_annotated: bool,
+        output_dir: Path,
+        inline_annotated: bool = False,
+    ) -> DetectionResponse:
+        """Build the API response for a single image result."""
         # Process detections
-        detections = self._extract_detections(result.boxes)
+        detections, class_ids = self._extract_detections(result.boxes)
 
-        # Create summary
-        labels = [d.label for d in detections]
-        summary = dict(Counter(labels))
+        # Create summary: per-class counts in one pass, names only for classes present
+        counts = np.bincount(class_ids, minlength=len(self._names))
+        summary = {self._names[i]: int(counts[i]) for i in np.flatnonzero(counts).tolist()}
 
-        # Get annotated image as base64
-        annotated_b64 = self._get_annotated_base64(result)
+        # Draw and encode at most once, and only if the annotated image is used
+        annotated_jpeg = None
+        if return_annotated or save_annotated:
+            annotated_jpeg = self._encode_jpeg(result.plot())
+
+        # Keep the JPEG for the binary endpoint and return its URL instead of base64,
+        # unless it goes back inline with the response itself
+        request_id = annotated_url = None
+        if return_annotated and not inline_annotated:
+            request_id = self.image_store.put(annotated_jpeg)
+            annotated_url = self.image_store.url_for(request_id)
 
         # Save to disk if requested
         if save_annotated:
-            self._save_annotated_image(result)
-
-        return DetectionResponse(
-            detections=detections, summary=summary, annotated_image=annotated_b64
+            self._save_annotated_image(annotated_jpeg, output_dir)
+
+        # Values come from our own arrays and are already well-typed, so skip validation
+        response = DetectionResponse.model_construct(
+            detections=detections,
+            summary=summary,
+            request_id=request_id,
+            annotated_image=annotated_url,
         )
-
-    def _extract_detections(self, boxes: Boxes) -> list[Detection]:
-        """Extract detection objects from YOLO boxes."""
-        detections = []
-
-        for box in boxes:
-            x1, y1, x2, y2 = box.xyxy[0].tolist()
-            score = float(box.conf[0])
-            class_id = int(box.cls[0])
-            label = self.model.names[class_id]
-
-            detections.append(
-                Detection(
-                    box=[int(x1), int(y1), int(x2), int(y2)], label=label, score=round(score, 2)
-                )
-            )
-
-        return detections
-
-    def _get_annotated_base64(self, result: Results) -> str:
-        """Get annotated image as base64 string."""
-        annotated_img = result.plot()
-        # Convert BGR to RGB
-        annotated_rgb = cv2.cvtColor(annotated_img, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(annotated_rgb)
-
-        buffer = BytesIO()
-        pil_img.save(buffer, format="JPEG", quality=85)
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-    def _save_annotated_image(self, result: Results) -> None:
-        """Save annotated image to disk."""
-        annotated_img = result.plot()
-        output_path = self.output_dir / "last_annotated.jpg"
-        cv2.imwrite(str(output_path), annotated_img)
+        if return_annotated and inline_annotated:
+            response.annotated_jpeg = annotated_jpeg
+        return response
+
+    def _extract_detections(self, boxes: Boxes) -> tuple[list[Detection], np.ndarray]:
+        """Extract detection objects and their class ids from YOLO boxes."""
+        # One device-to-host copy per tensor instead of one per box
+        xyxy = boxes.xyxy.cpu().numpy().astype(np.int32).tolist()
+        scores = boxes.conf.cpu().numpy().astype(np.float64).round(2).tolist()
+        class_ids = boxes.cls.cpu().numpy().astype(np.int64)
+        names = self._names
+
+        detections = [
+            Detection.model_construct(box=box, label=names[class_id], score=score)
+            for box, score, class_id in zip(xyxy, scores, class_ids.tolist(), strict=True)
+        ]
+        return detections, class_ids
+
+    def _encode_jpeg(self, annotated_img: np.ndarray) -> bytes:
+        """Encode annotated (BGR) image as JPEG bytes."""
+        # Encode straight from BGR, no color conversion or PIL roundtrip
+        return simplejpeg.encode_jpeg(annotated_img, quality=85, colorspace="BGR", fastdct=True)
+
+    def _save_annotated_image(self, annotated_jpeg: bytes, output_dir: Path) -> None:
+        """Save annotated JPEG bytes to disk."""
+        output_path = output_dir / "last_annotated.jpg"
+        output_path.write_bytes(annotated_jpeg)
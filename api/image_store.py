@@ -0,0 +1,144 @@
+"""
+Short-lived stores for annotated images.
+Lets /detect return a URL to the JPEG instead of inlining it as base64.
+"""
+
+import contextlib
+import os
+import re
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
+# Route serving stored images; formatted with the id returned by put()
+ANNOTATED_IMAGE_ROUTE = "/detect/{request_id}/annotated.jpg"
+
+# Format of the ids generated by put() (uuid4 hex)
+_REQUEST_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class ImageStore(ABC):
+    """
+    Base for the annotated image stores: TTL and size limits, URL routing.
+
+    Subclasses implement put() and get(). Entries expire after ttl_seconds and
+    the oldest are evicted once max_entries is reached, so usage stays bounded.
+    """
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def put(self, jpeg_bytes: bytes) -> str:
+        """Store an image and return its request id."""
+
+    @abstractmethod
+    def get(self, request_id: str) -> bytes | None:
+        """Return the stored image, or None if unknown or expired."""
+
+    def url_for(self, request_id: str) -> str:
+        """Path of the endpoint serving the stored image."""
+        return ANNOTATED_IMAGE_ROUTE.format(request_id=request_id)
+
+
+class AnnotatedImageStore(ImageStore):
+    """Thread-safe in-memory TTL cache of JPEG bytes keyed by a generated request id."""
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 256):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self._images: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, jpeg_bytes: bytes) -> str:
+        """Store an image and return its request id."""
+        request_id = uuid.uuid4().hex
+        expires_at = time.monotonic() + self.ttl_seconds
+
+        with self._lock:
+            self._evict_expired()
+            while len(self._images) >= self.max_entries:
+                self._images.popitem(last=False)
+            self._images[request_id] = (expires_at, jpeg_bytes)
+
+        return request_id
+
+    def get(self, request_id: str) -> bytes | None:
+        """Return the stored image, or None if unknown or expired."""
+        with self._lock:
+            entry = self._images.get(request_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            return entry[1]
+
+    def _evict_expired(self) -> None:
+        # Insertion order matches expiry order, so stop at the first live entry
+        now = time.monotonic()
+        while self._images:
+            request_id, (expires_at, _) = next(iter(self._images.items()))
+            if expires_at >= now:
+                break
+            del self._images[request_id]
+
+
+class DirectoryImageStore(ImageStore):
+    """
+    TTL store that keeps images as files so every worker process can serve them.
+
+    Used when the API runs several workers: a follow-up GET may reach a
+    different process than the /detect call that stored the image. The file
+    count is capped at max_entries across all workers sharing the directory.
+    """
+
+    def __init__(self, directory: Path, ttl_seconds: float = 60.0, max_entries: int = 256):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def put(self, jpeg_bytes: bytes) -> str:
+        """Store an image and return its request id."""
+        request_id = uuid.uuid4().hex
+        self._path(request_id).write_bytes(jpeg_bytes)
+        self._evict()
+        return request_id
+
+    def get(self, request_id: str) -> bytes | None:
+        """Return the stored image, or None if unknown or expired."""
+        # Ids come from the URL; only accept ones put() could have generated
+        if not _REQUEST_ID.fullmatch(request_id):
+            return None
+        try:
+            path = self._path(request_id)
+            if path.stat().st_mtime + self.ttl_seconds < time.time():
+                return None
+            return path.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _path(self, request_id: str) -> Path:
+        return self.directory / f"{request_id}.jpg"
+
+    def _evict(self) -> None:
+        # Other workers write here too, so the directory listing is the only shared count
+        cutoff = time.time() - self.ttl_seconds
+        live = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(".jpg"):
+                    continue
+                # Files can disappear under us when another worker evicts them
+                with contextlib.suppress(FileNotFoundError):
+                    mtime = entry.stat().st_mtime
+                    if mtime < cutoff:
+                        os.unlink(entry.path)
+                    else:
+                        live.append((mtime, entry.path))
+
+        # Oldest files go first once over capacity
+        live.sort()
+        for _, path in live[: max(0, len(live) - self.max_entries)]:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(path)
@@ -1,20 +1,62 @@
 # ruff: noqa: I001
-import asyncio
-
-from fastapi import Depends, FastAPI, File, Request, UploadFile
-from fastapi.responses import JSONResponse
+import os
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numba
+import numpy as np
+import torch
+from fastapi import Depends, FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
 
 # Support both package imports (for testing) and direct imports (for Docker)
 try:  # noqa: I001
-    from .config import MODEL_PATH, OUTPUT_DIR
+    from .batcher import MicroBatcher
+    from .config import (
+        ANNOTATED_MAX_ENTRIES,
+        ANNOTATED_TTL_SECONDS,
+        BATCH_MAX_SIZE,
+        BATCH_WINDOW_MS,
+        MODEL_PATH,
+        OUTPUT_DIR,
+        WARMUP_RUNS,
+        WORKERS,
+    )
     from .detector_service import DetectorService
+    from .image_store import (
+        ANNOTATED_IMAGE_ROUTE,
+        AnnotatedImageStore,
+        DirectoryImageStore,
+        ImageStore,
+    )
     from .models import DetectionRequest, DetectionResponse, ImageValidationError
 except ImportError:
-    from config import MODEL_PATH, OUTPUT_DIR
+    from batcher import MicroBatcher
+    from config import (
+        ANNOTATED_MAX_ENTRIES,
+        ANNOTATED_TTL_SECONDS,
+        BATCH_MAX_SIZE,
+        BATCH_WINDOW_MS,
+        MODEL_PATH,
+        OUTPUT_DIR,
+        WARMUP_RUNS,
+        WORKERS,
+    )
     from detector_service import DetectorService
+    from image_store import (
+        ANNOTATED_IMAGE_ROUTE,
+        AnnotatedImageStore,
+        DirectoryImageStore,
+        ImageStore,
+    )
 
     from models import DetectionRequest, DetectionResponse, ImageValidationError
 
+# Keep the default response class: with a response_model set, FastAPI serializes
+# straight to JSON bytes in Pydantic's Rust core (a custom class like ORJSONResponse
+# would force a Python dict + re-encode instead)
 app = FastAPI(title="YOLOv8 Object Detection API")
 
 
@@ -27,8 +69,97 @@ async def image_validation_exception_handler(request: Request, exc: ImageValidat
     )
 
 
+def _make_image_store(workers: int) -> ImageStore:
+    """
+    Pick the store for annotated images served by URL.
+
+    Worker processes don't share memory, so with several workers (WEB_CONCURRENCY)
+    images go on disk where any worker can serve them.
+    """
+    if workers > 1:
+        return DirectoryImageStore(
+            OUTPUT_DIR / "annotated",
+            ttl_seconds=ANNOTATED_TTL_SECONDS,
+            max_entries=ANNOTATED_MAX_ENTRIES,
+        )
+    return AnnotatedImageStore(ttl_seconds=ANNOTATED_TTL_SECONDS, max_entries=ANNOTATED_MAX_ENTRIES)
+
+
+image_store = _make_image_store(WORKERS)
+
 # Initialize detector service on startup
-detector = DetectorService(model_path=MODEL_PATH, output_dir=OUTPUT_DIR)
+detector = DetectorService(
+    model_path=MODEL_PATH,
+    output_dir=OUTPUT_DIR,
+    warmup_runs=WARMUP_RUNS,
+    image_store=image_store,
+)
+
+
+def get_output_dir() -> Path:
+    """Directory a request's annotated image is saved to; tests override this dependency."""
+    return OUTPUT_DIR
+
+
+def _detect_batch(
+    jobs: list[tuple[np.ndarray, DetectionRequest, Path]],
+) -> list[DetectionResponse]:
+    """Run batched detections for requests queued by the batcher, one model call per imgsz."""
+    by_size: dict[int, list[int]] = defaultdict(list)
+    for i, (_, request, _) in enumerate(jobs):
+        by_size[request.imgsz].append(i)
+
+    responses: dict[int, DetectionResponse] = {}
+    for imgsz, indices in by_size.items():
+        group = [jobs[i] for i in indices]
+        results = detector.detect_batch(
+            [img for img, _, _ in group],
+            [request.confidence_threshold for _, request, _ in group],
+            return_annotated=[request.return_annotated for _, request, _ in group],
+            imgsz=imgsz,
+            output_dirs=[output_dir for _, _, output_dir in group],
+            inline_annotated=[request.inline_annotated for _, request, _ in group],
+        )
+        responses.update(zip(indices, results, strict=True))
+    return [responses[i] for i in range(len(jobs))]
+
+
+def _init_inference_thread() -> None:
+    """Give each worker process an equal share of CPU cores for inference."""
+    if WORKERS > 1:
+        threads = max(1, (os.cpu_count() or 1) // WORKERS)
+        torch.set_num_threads(threads)
+        # Numba's setting is per calling thread, hence done on the inference thread
+        numba.set_num_threads(threads)
+
+
+# One dedicated inference thread: batches run back to back instead of several
+# threads contending for the same model/device and the GIL
+inference_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="yolo", initializer=_init_inference_thread
+)
+
+batcher = MicroBatcher(
+    _detect_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    window_ms=BATCH_WINDOW_MS,
+    executor=inference_executor,
+)
+
+
+def _multipart_mixed(response: DetectionResponse) -> Response:
+    """Send the JSON result and the raw annotated JPEG as two parts of one body."""
+    boundary = uuid.uuid4().hex
+    body = b"".join(
+        (
+            f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+            response.model_dump_json().encode(),
+            f"\r\n--{boundary}\r\nContent-Type: image/jpeg\r\n\r\n".encode(),
+            response.annotated_jpeg,
+            f"\r\n--{boundary}--\r\n".encode(),
+        )
+    )
+    return Response(content=body, media_type=f"multipart/mixed; boundary={boundary}")
 
 
 @app.get("/health")
@@ -36,28 +167,54 @@ def health_check():
     return {"status": "ok"}
 
 
-@app.post("/detect", response_model=DetectionResponse)
+@app.post(
+    "/detect",
+    response_model=DetectionResponse,
+    responses={200: {"content": {"multipart/mixed": {}}}},
+)
 async def detect_objects(
     image: UploadFile = File(...),
     request: DetectionRequest = Depends(DetectionRequest.from_form),
-) -> DetectionResponse:
+    output_dir: Path = Depends(get_output_dir),
+) -> DetectionResponse | Response:
     """
     Detect objects in an uploaded image.
 
-    Runs detection in a thread pool to avoid blocking the event loop.
+    Concurrent requests are micro-batched into a single model call, which runs
+    on a dedicated inference thread to avoid blocking the event loop.
+
+    With return_annotated and an ``Accept: multipart/mixed`` header, the JSON
+    result and the annotated JPEG come back together as a two-part body,
+    saving the client a second request for the image. The image is then not
+    kept in the store, so request_id and annotated_image are null.
 
     Args:
         image: Image file to process
         request: Detection parameters and validation logic
+        output_dir: Directory the annotated image is saved to
 
     Returns:
         Detection results with bounding boxes, labels, scores, and summary
     """
+    # Single copy into bytes; decoding wraps them with np.frombuffer (no further copy)
     image_bytes = await image.read()
     img = request.validate_image(image_bytes)
 
-    # Run detection in thread pool to avoid blocking
-    loop = asyncio.get_event_loop()
-    result = await loop.run_in_executor(None, detector.detect, img, request.confidence_threshold)
+    response = await batcher.submit((img, request, output_dir))
+
+    if response.annotated_jpeg is not None:
+        return _multipart_mixed(response)
+    return response
 
-    return result
+
+@app.get(ANNOTATED_IMAGE_ROUTE)
+def get_annotated_image(request_id: str) -> Response:
+    """
+    Return the annotated JPEG stored by a /detect call with return_annotated.
+
+    Images expire after ANNOTATED_TTL_SECONDS.
+    """
+    jpeg_bytes = image_store.get(request_id)
+    if jpeg_bytes is None:
+        raise HTTPException(status_code=404, detail="Annotated image not found or expired")
+    return Response(content=jpeg_bytes, media_type="image/jpeg")
@@ -1,8 +1,7 @@
-import io
-
-from fastapi import Form
-from PIL import Image, UnidentifiedImageError
-from pydantic import BaseModel, Field
+import cv2
+import numpy as np
+from fastapi import Form, Header
+from pydantic import BaseModel, Field, PrivateAttr
 
 
 class ImageValidationError(ValueError):
@@ -18,48 +17,64 @@ class DetectionRequest(BaseModel):
     """
 
     confidence_threshold: float = Field(0.25, ge=0.0, le=1.0)
+    return_annotated: bool = False
+    # Inference size; cost grows with its square, so smaller sizes trade accuracy for speed
+    imgsz: int = Field(640, ge=32, le=1280, multiple_of=32)
+    # Return the image inline (multipart/mixed) instead of storing it; from the Accept header
+    inline_annotated: bool = False
 
     @classmethod
     def from_form(
-        cls, confidence_threshold: float = Form(0.25, ge=0.0, le=1.0)
+        cls,
+        confidence_threshold: float = Form(0.25, ge=0.0, le=1.0),
+        return_annotated: bool = Form(False),
+        imgsz: int = Form(640, ge=32, le=1280, multiple_of=32),
+        accept: str | None = Header(None),
     ) -> "DetectionRequest":
         """
-        Helper to create DetectionRequest from form data.
+        Helper to create DetectionRequest from form data and the Accept header.
         """
-        return cls(confidence_threshold=confidence_threshold)
+        return cls(
+            confidence_threshold=confidence_threshold,
+            return_annotated=return_annotated,
+            imgsz=imgsz,
+            inline_annotated=accept is not None and "multipart/mixed" in accept,
+        )
 
     @staticmethod
-    def validate_image(image_bytes: bytes) -> Image.Image:
+    def validate_image(image_bytes: bytes) -> np.ndarray:
         """
-        Validate that the provided bytes are a valid, non-corrupted image.
+        Validate that the provided bytes are a valid, non-corrupted image and decode it.
 
         Args:
             image_bytes: Raw bytes of the uploaded file.
 
         Returns:
-            PIL.Image.Image: The opened image object.
+            np.ndarray: The decoded image (HxWx3, uint8, BGR as expected by YOLO).
 
         Raises:
             ImageValidationError: If image is invalid or corrupted.
         """
-        try:
-            img = Image.open(io.BytesIO(image_bytes))
-
-            # Catches truncated/corrupted files
-            img.verify()
-
-            # Re-open because verify() consumes the file pointer/closes the image
-            img = Image.open(io.BytesIO(image_bytes))
-            return img
-
-        except (UnidentifiedImageError, ValueError, TypeError) as e:
+        if not image_bytes:
             raise ImageValidationError(
-                f"Invalid image file: {str(e)}. Please upload a valid image (JPEG, PNG, etc.)."
-            ) from e
+                "Invalid image file: empty upload. Please upload a valid image (JPEG, PNG, etc.)."
+            )
 
+        try:
+            # Single decode straight into the array the model consumes
+            img = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
         except Exception as e:
             raise ImageValidationError(f"Error processing image: {str(e)}") from e
 
+        # imdecode returns None for unknown formats and truncated/corrupted files
+        if img is None:
+            raise ImageValidationError(
+                "Invalid image file: could not decode image data. "
+                "Please upload a valid image (JPEG, PNG, etc.)."
+            )
+
+        return img
+
 
 class Detection(BaseModel):
     box: list[int]  # [x1, y1, x2, y2]
@@ -70,4 +85,16 @@ class Detection(BaseModel):
 class DetectionResponse(BaseModel):
     detections: list[Detection]
     summary: dict[str, int]
-    annotated_image: str | None = None  # Base64 encoded image
+    request_id: str | None = None  # Set when the annotated image was stored
+    annotated_image: str | None = None  # URL of the annotated JPEG
+    # Annotated JPEG kept out of the JSON, for responses that carry it inline
+    _annotated_jpeg: bytes | None = PrivateAttr(None)
+
+    @property
+    def annotated_jpeg(self) -> bytes | None:
+        """Annotated JPEG bytes when requested inline, else None."""
+        return self._annotated_jpeg
+
+    @annotated_jpeg.setter
+    def annotated_jpeg(self, jpeg_bytes: bytes | None) -> None:
+        self._annotated_jpeg = jpeg_bytes
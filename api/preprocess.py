@@ -0,0 +1,89 @@
+"""
+CPU preprocessing compiled with Numba.
+Letterboxes frames in one fused pass instead of Ultralytics' NumPy/OpenCV steps.
+"""
+
+import numpy as np
+from numba import njit, prange
+
+# Padding value used by Ultralytics' LetterBox
+LETTERBOX_FILL = 114.0
+
+
+def letterbox_params(
+    shape: tuple[int, int], new_shape: tuple[int, int], auto: bool, stride: int
+) -> tuple[tuple[int, int], tuple[int, int, int, int]]:
+    """
+    Compute the resized size and (top, bottom, left, right) padding for a frame.
+
+    Same geometry as Ultralytics' LetterBox: aspect-preserving resize, then
+    centered padding up to new_shape (or to the next stride multiple if auto).
+    """
+    h, w = shape
+    r = min(new_shape[0] / h, new_shape[1] / w)
+    # At least one pixel, or extreme aspect ratios (e.g. 1x3000) resize to nothing
+    unpad_h, unpad_w = max(1, round(h * r)), max(1, round(w * r))
+    dh, dw = new_shape[0] - unpad_h, new_shape[1] - unpad_w
+    if auto:  # minimum rectangle
+        dh, dw = dh % stride, dw % stride
+
+    top, left = round(dh / 2 - 0.1), round(dw / 2 - 0.1)
+    return (unpad_h, unpad_w), (top, dh - top, left, dw - left)
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def letterbox_chw(
+    img: np.ndarray, out: np.ndarray, unpad_h: int, unpad_w: int, top: int, left: int
+) -> None:
+    """
+    Letterbox a uint8 HWC BGR frame into a preallocated float32 CHW RGB array.
+
+    Bilinear resize (half-pixel centers, as cv2.INTER_LINEAR), gray padding,
+    channel swap, transpose and /255 are fused into one loop over output rows,
+    which are split across threads. img must be C-contiguous.
+    """
+    h, w = img.shape[0], img.shape[1]
+    out_h = out.shape[1]
+    fill = np.float32(LETTERBOX_FILL / 255)
+    norm = np.float32(1 / 255)
+
+    # Source columns and weights are the same for every row, so compute them once
+    scale_x = w / unpad_w
+    x0s = np.empty(unpad_w, np.int64)
+    x1s = np.empty(unpad_w, np.int64)
+    fxs = np.empty(unpad_w, np.float32)
+    for ix in range(unpad_w):
+        sx = max((ix + 0.5) * scale_x - 0.5, 0.0)
+        x0 = int(sx)
+        x0s[ix] = x0 * 3  # offsets into a flattened HWC row
+        x1s[ix] = min(x0 + 1, w - 1) * 3
+        fxs[ix] = sx - x0
+
+    flat = img.reshape(h, w * 3)
+    scale_y = h / unpad_h
+    for y in prange(out_h):
+        iy = y - top
+        if iy < 0 or iy >= unpad_h:
+            out[:, y, :] = fill
+            continue
+
+        sy = max((iy + 0.5) * scale_y - 0.5, 0.0)
+        y0 = int(sy)
+        y1 = min(y0 + 1, h - 1)
+        fy = np.float32(sy - y0)
+
+        # Blend the two source rows first (contiguous, vectorizes), then sample columns
+        src0, src1 = flat[y0], flat[y1]
+        row = np.empty(w * 3, np.float32)
+        for k in range(w * 3):
+            a = np.float32(src0[k])
+            row[k] = (a + (np.float32(src1[k]) - a) * fy) * norm
+
+        out[:, y, :left] = fill
+        out[:, y, left + unpad_w :] = fill
+        for c in range(3):
+            src = 2 - c  # BGR -> RGB
+            dst = out[c, y, left : left + unpad_w]
+            for ix in range(unpad_w):
+                a = row[x0s[ix] + src]
+                dst[ix] = a + (row[x1s[ix] + src] - a) * fxs[ix]
@@ -0,0 +1,19 @@
+#!/bin/bash
+# Export the YOLOv8 checkpoint to a TensorRT engine (requires an NVIDIA GPU with TensorRT installed)
+set -e
+
+MODEL=${1:-models/yolov8n.pt}
+# Largest inference size the engine accepts; requests may use any smaller multiple of 32
+IMGSZ=${IMGSZ:-640}
+
+# FP16 by default; set INT8=1 and CALIB_DATA=<dataset.yaml> for an INT8 engine
+if [ "${INT8:-0}" = "1" ]; then
+    PRECISION="int8=True data=${CALIB_DATA:?CALIB_DATA must point to a calibration dataset yaml}"
+else
+    PRECISION="half=True"
+fi
+
+# Dynamic shapes with batch up to 8 so one engine serves any image size and micro-batches
+yolo export model="$MODEL" format=engine $PRECISION dynamic=True batch=8 imgsz="$IMGSZ"
+
+echo "Engine exported to ${MODEL%.*}.engine - set MODEL_PATH to use it"
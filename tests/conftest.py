@@ -1,5 +1,6 @@
 import io
 
+import numpy as np
 import pytest
 from PIL import Image
 
@@ -14,6 +15,14 @@ def sample_image():
     return img
 
 
+@pytest.fixture
+def sample_array(sample_image):
+    """
+    The test image as the BGR uint8 array the detector takes.
+    """
+    return np.array(sample_image)[..., ::-1]
+
+
 @pytest.fixture
 def sample_image_bytes(sample_image):
     """
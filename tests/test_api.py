@@ -2,10 +2,12 @@
 Integration tests for API endpoints.
 """
 
+import json
 from unittest.mock import patch
 
 import pytest
 from fastapi.testclient import TestClient
+from requests_toolbelt.multipart.decoder import MultipartDecoder
 
 from api.main import app
 
@@ -46,10 +48,12 @@ class TestDetectEndpoint:
         # Setup: Mock detector to return fake results
         from api.models import Detection, DetectionResponse
 
-        mock_detector.detect.return_value = DetectionResponse(
-            detections=[Detection(box=[100, 100, 200, 200], label="person", score=0.92)],
-            summary={"person": 1},
-        )
+        mock_detector.detect_batch.return_value = [
+            DetectionResponse(
+                detections=[Detection(box=[100, 100, 200, 200], label="person", score=0.92)],
+                summary={"person": 1},
+            )
+        ]
 
         # Execute: Send POST with file and form data
         response = client.post(
@@ -83,13 +87,15 @@ class TestDetectEndpoint:
         from api.models import Detection, DetectionResponse
 
         # Setup: Mock multiple detections
-        mock_detector.detect.return_value = DetectionResponse(
-            detections=[
-                Detection(box=[150, 200, 250, 400], label="person", score=0.92),
-                Detection(box=[300, 150, 450, 250], label="car", score=0.88),
-            ],
-            summary={"person": 1, "car": 1},
-        )
+        mock_detector.detect_batch.return_value = [
+            DetectionResponse(
+                detections=[
+                    Detection(box=[150, 200, 250, 400], label="person", score=0.92),
+                    Detection(box=[300, 150, 450, 250], label="car", score=0.88),
+                ],
+                summary={"person": 1, "car": 1},
+            )
+        ]
 
         # Execute
         response = client.post(
@@ -117,7 +123,7 @@ class TestDetectEndpoint:
         from api.models import DetectionResponse
 
         # Setup: Empty detections
-        mock_detector.detect.return_value = DetectionResponse(detections=[], summary={})
+        mock_detector.detect_batch.return_value = [DetectionResponse(detections=[], summary={})]
 
         # Execute
         response = client.post(
@@ -139,7 +145,7 @@ class TestDetectEndpoint:
         """
         from api.models import DetectionResponse
 
-        mock_detector.detect.return_value = DetectionResponse(detections=[], summary={})
+        mock_detector.detect_batch.return_value = [DetectionResponse(detections=[], summary={})]
 
         # Execute with custom threshold
         response = client.post(
@@ -150,11 +156,11 @@ class TestDetectEndpoint:
 
         # Assert: Endpoint called detector with correct threshold
         assert response.status_code == 200
-        mock_detector.detect.assert_called_once()
+        mock_detector.detect_batch.assert_called_once()
 
         # Check the confidence_threshold argument
-        call_args = mock_detector.detect.call_args
-        assert call_args.args[1] == 0.75  # Second arg is confidence_threshold
+        call_args = mock_detector.detect_batch.call_args
+        assert call_args.args[1] == [0.75]  # Second arg is the per-image thresholds
 
     def test_detect_endpoint_missing_image(self, client):
         """
@@ -172,7 +178,7 @@ class TestDetectEndpoint:
         """
         from api.models import DetectionResponse
 
-        mock_detector.detect.return_value = DetectionResponse(detections=[], summary={})
+        mock_detector.detect_batch.return_value = [DetectionResponse(detections=[], summary={})]
 
         # Execute: Don't provide confidence_threshold
         response = client.post(
@@ -181,8 +187,188 @@ class TestDetectEndpoint:
 
         # Assert: Should use default 0.25
         assert response.status_code == 200
-        call_args = mock_detector.detect.call_args
-        assert call_args.args[1] == 0.25
+        call_args = mock_detector.detect_batch.call_args
+        assert call_args.args[1] == [0.25]
+
+    def test_detect_endpoint_imgsz(self, client, mock_detector, sample_image_bytes):
+        """
+        Inference size defaults to 640 and can be lowered per request.
+        """
+        from api.models import DetectionResponse
+
+        mock_detector.detect_batch.return_value = [DetectionResponse(detections=[], summary={})]
+
+        client.post("/detect", files={"image": ("test.jpg", sample_image_bytes, "image/jpeg")})
+        assert mock_detector.detect_batch.call_args.kwargs["imgsz"] == 640
+
+        client.post(
+            "/detect",
+            files={"image": ("test.jpg", sample_image_bytes, "image/jpeg")},
+            data={"imgsz": "416"},
+        )
+        assert mock_detector.detect_batch.call_args.kwargs["imgsz"] == 416
+
+    @pytest.mark.parametrize("imgsz", ["400", "0", "1600"])
+    def test_detect_endpoint_invalid_imgsz(self, client, mock_detector, sample_image_bytes, imgsz):
+        """
+        Inference sizes must be multiples of 32 within the supported range.
+        """
+        response = client.post(
+            "/detect",
+            files={"image": ("test.jpg", sample_image_bytes, "image/jpeg")},
+            data={"imgsz": imgsz},
+        )
+
+        assert response.status_code == 422
+        mock_detector.detect_batch.assert_not_called()
+
+    def test_batch_grouped_by_imgsz(self, mock_detector):
+        """
+        A micro-batch with mixed sizes runs one model call per size, keeping order.
+        """
+        import numpy as np
+
+        from api.config import OUTPUT_DIR
+        from api.main import _detect_batch
+        from api.models import DetectionRequest
+
+        mock_detector.detect_batch.side_effect = lambda images, thresholds, **kwargs: [
+            (kwargs["imgsz"], threshold) for threshold in thresholds
+        ]
+        img = np.zeros((8, 8, 3), dtype=np.uint8)
+        jobs = [
+            (img, DetectionRequest(confidence_threshold=0.1, imgsz=320), OUTPUT_DIR),
+            (img, DetectionRequest(confidence_threshold=0.2, imgsz=640), OUTPUT_DIR),
+            (img, DetectionRequest(confidence_threshold=0.3, imgsz=320), OUTPUT_DIR),
+        ]
+
+        assert _detect_batch(jobs) == [(320, 0.1), (640, 0.2), (320, 0.3)]
+        assert mock_detector.detect_batch.call_count == 2
+
+    def test_detect_endpoint_return_annotated(self, client, mock_detector, sample_image_bytes):
+        """
+        Annotated image is only requested from the detector when asked for.
+        """
+        from api.models import DetectionResponse
+
+        mock_detector.detect_batch.return_value = [DetectionResponse(detections=[], summary={})]
+
+        # Default: not requested
+        client.post("/detect", files={"image": ("test.jpg", sample_image_bytes, "image/jpeg")})
+        assert mock_detector.detect_batch.call_args.kwargs["return_annotated"] == [False]
+
+        # Explicitly requested
+        client.post(
+            "/detect",
+            files={"image": ("test.jpg", sample_image_bytes, "image/jpeg")},
+            data={"return_annotated": "true"},
+        )
+        assert mock_detector.detect_batch.call_args.kwargs["return_annotated"] == [True]
+
+    def test_annotated_image_endpoint(self, client):
+        """
+        Stored annotated images are served as raw JPEG bytes.
+        """
+        from api.main import image_store
+
+        request_id = image_store.put(b"\xff\xd8fake-jpeg")
+
+        response = client.get(image_store.url_for(request_id))
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "image/jpeg"
+        assert response.content == b"\xff\xd8fake-jpeg"
+
+    def test_annotated_image_endpoint_unknown_id(self, client):
+        """
+        Unknown or expired ids return 404.
+        """
+        response = client.get("/detect/does-not-exist/annotated.jpg")
+
+        assert response.status_code == 404
+
+    def test_detect_endpoint_multipart_mixed(self, client, mock_detector, sample_image_bytes):
+        """
+        Accept: multipart/mixed returns the JSON result and the raw JPEG in one body.
+        """
+        from api.models import DetectionResponse
+
+        inline = DetectionResponse(detections=[], summary={"person": 1})
+        inline.annotated_jpeg = b"\xff\xd8fake-jpeg"
+        mock_detector.detect_batch.return_value = [inline]
+        files = {"image": ("test.jpg", sample_image_bytes, "image/jpeg")}
+        data = {"return_annotated": "true"}
+
+        response = client.post(
+            "/detect", files=files, data=data, headers={"Accept": "multipart/mixed"}
+        )
+
+        # Assert: Image requested inline, so the detector doesn't store it
+        assert mock_detector.detect_batch.call_args.kwargs["inline_annotated"] == [True]
+        assert response.status_code == 200
+        json_part, image_part = MultipartDecoder.from_response(response).parts
+        assert json_part.headers[b"Content-Type"] == b"application/json"
+        assert json.loads(json_part.content)["summary"] == {"person": 1}
+        assert image_part.headers[b"Content-Type"] == b"image/jpeg"
+        assert image_part.content == b"\xff\xd8fake-jpeg"
+
+    def test_detect_endpoint_without_multipart_accept(
+        self, client, mock_detector, sample_image_bytes
+    ):
+        """
+        Without Accept: multipart/mixed the response stays plain JSON with a URL.
+        """
+        from api.models import DetectionResponse
+
+        mock_detector.detect_batch.return_value = [
+            DetectionResponse(
+                detections=[],
+                summary={},
+                request_id="ab",
+                annotated_image="/detect/ab/annotated.jpg",
+            )
+        ]
+
+        response = client.post(
+            "/detect",
+            files={"image": ("test.jpg", sample_image_bytes, "image/jpeg")},
+            data={"return_annotated": "true"},
+        )
+
+        assert mock_detector.detect_batch.call_args.kwargs["inline_annotated"] == [False]
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["annotated_image"] == "/detect/ab/annotated.jpg"
+
+    def test_detect_endpoint_decodes_to_bgr_array(self, client, mock_detector, sample_image_bytes):
+        """
+        Uploaded image is decoded once into the BGR array the model expects.
+        """
+        from api.models import DetectionResponse
+
+        mock_detector.detect_batch.return_value = [DetectionResponse(detections=[], summary={})]
+
+        response = client.post(
+            "/detect", files={"image": ("test.jpg", sample_image_bytes, "image/jpeg")}
+        )
+
+        assert response.status_code == 200
+        img = mock_detector.detect_batch.call_args.args[0][0]
+        assert img.shape == (480, 640, 3)
+        # Red test image: red is the last channel in BGR order
+        assert img[..., 2].mean() > 200 and img[..., 0].mean() < 50
+
+    def test_detect_endpoint_empty_file(self, client):
+        """
+        Verify 400 error when uploading an empty file.
+        """
+        response = client.post(
+            "/detect",
+            files={"image": ("empty.jpg", b"", "image/jpeg")},
+            data={"confidence_threshold": "0.25"},
+        )
+
+        assert response.status_code == 400
+        assert "Invalid image file" in response.json()["detail"]
 
     def test_detect_endpoint_invalid_image(self, client):
         """
@@ -218,6 +404,54 @@ class TestDetectEndpoint:
         assert "Invalid image file" in response.json()["detail"]
 
 
+class TestAppSetup:
+    """Test suite for per-process setup that depends on the worker count."""
+
+    def test_single_worker_uses_memory_store(self):
+        """
+        One process can serve its own images from memory.
+        """
+        from api.image_store import AnnotatedImageStore
+        from api.main import _make_image_store
+
+        assert isinstance(_make_image_store(1), AnnotatedImageStore)
+
+    def test_several_workers_use_directory_store(self, tmp_path):
+        """
+        With several workers, images go to a directory every worker can read.
+        """
+        from api.image_store import DirectoryImageStore
+        from api.main import _make_image_store
+
+        with patch("api.main.OUTPUT_DIR", tmp_path):
+            store = _make_image_store(4)
+
+        assert isinstance(store, DirectoryImageStore)
+        assert store.directory == tmp_path / "annotated"
+
+    @pytest.mark.parametrize(("workers", "expected"), [(1, None), (4, 2)])
+    def test_inference_thread_gets_share_of_cores(self, workers, expected):
+        """
+        CPU threads are split between workers, and left alone with one worker.
+        """
+        from api.main import _init_inference_thread
+
+        with (
+            patch("api.main.WORKERS", workers),
+            patch("api.main.os.cpu_count", return_value=8),
+            patch("api.main.torch.set_num_threads") as torch_threads,
+            patch("api.main.numba.set_num_threads") as numba_threads,
+        ):
+            _init_inference_thread()
+
+        if expected is None:
+            torch_threads.assert_not_called()
+            numba_threads.assert_not_called()
+        else:
+            torch_threads.assert_called_once_with(expected)
+            numba_threads.assert_called_once_with(expected)
+
+
 class TestOpenAPISchema:
     """Test OpenAPI documentation generation."""
 
@@ -0,0 +1,150 @@
+"""
+Unit tests for MicroBatcher.
+"""
+
+import asyncio
+import gc
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from api.batcher import MicroBatcher
+
+
+class TestMicroBatcher:
+    """Test suite for MicroBatcher class."""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_items_share_a_batch(self):
+        """
+        Items submitted together are processed in one call, results routed back in order.
+        """
+        calls = []
+
+        def process(items):
+            calls.append(items)
+            return [item * 10 for item in items]
+
+        batcher = MicroBatcher(process, max_batch_size=8, window_ms=50)
+
+        # Execute: Submit three items concurrently
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(3)))
+
+        # Assert: One batch, each caller got its own result
+        assert calls == [[0, 1, 2]]
+        assert results == [0, 10, 20]
+
+    @pytest.mark.asyncio
+    async def test_batch_size_is_capped(self):
+        """
+        Batches never exceed max_batch_size.
+        """
+        calls = []
+
+        def process(items):
+            calls.append(items)
+            return items
+
+        batcher = MicroBatcher(process, max_batch_size=2, window_ms=50)
+
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+
+        assert results == [0, 1, 2, 3, 4]
+        assert all(len(batch) <= 2 for batch in calls)
+        assert sum(len(batch) for batch in calls) == 5
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate_to_every_caller(self):
+        """
+        A failing batch raises in each request waiting on it.
+        """
+
+        def process(items):
+            raise RuntimeError("inference failed")
+
+        batcher = MicroBatcher(process, window_ms=50)
+
+        results = await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    @pytest.mark.asyncio
+    async def test_error_only_reaches_failing_item(self):
+        """
+        One bad item in a batch fails alone; the others still get their results.
+        """
+        calls = []
+
+        def process(items):
+            calls.append(items)
+            if "bad" in items:
+                raise ValueError("bad item")
+            return [item.upper() for item in items]
+
+        batcher = MicroBatcher(process, window_ms=50)
+
+        results = await asyncio.gather(
+            batcher.submit("good"), batcher.submit("bad"), return_exceptions=True
+        )
+
+        assert results[0] == "GOOD"
+        assert isinstance(results[1], ValueError)
+        # Shared batch first, then each item on its own
+        assert calls == [["good", "bad"], ["good"], ["bad"]]
+
+    @pytest.mark.asyncio
+    async def test_worker_recovers_after_error(self):
+        """
+        The worker keeps serving requests after a failed batch.
+        """
+        fail = True
+
+        def process(items):
+            if fail:
+                raise RuntimeError("inference failed")
+            return items
+
+        batcher = MicroBatcher(process, window_ms=0)
+
+        with pytest.raises(RuntimeError):
+            await batcher.submit(1)
+
+        fail = False
+        assert await batcher.submit(2) == 2
+
+    @pytest.mark.asyncio
+    async def test_runs_on_given_executor(self):
+        """
+        Batches run on the executor passed in, not the default thread pool.
+        """
+        threads = []
+
+        def process(items):
+            threads.append(threading.current_thread().name)
+            return items
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo") as executor:
+            batcher = MicroBatcher(process, window_ms=0, executor=executor)
+            await batcher.submit(1)
+
+        assert threads[0].startswith("yolo")
+
+    def test_previous_loops_are_released(self):
+        """
+        Each new event loop replaces the last one's worker, so old loops can be freed.
+        """
+        batcher = MicroBatcher(lambda items: items, window_ms=0)
+        loops = []
+
+        async def submit():
+            loops.append(weakref.ref(asyncio.get_running_loop()))
+            return await batcher.submit(1)
+
+        for _ in range(5):
+            assert asyncio.run(submit()) == 1
+        gc.collect()
+
+        # Only the latest loop is still referenced (by the batcher)
+        assert [ref() is None for ref in loops] == [True, True, True, True, False]
@@ -6,11 +6,22 @@ from unittest.mock import Mock, patch
 
 import numpy as np
 import pytest
+import simplejpeg
+import torch
+from ultralytics.engine.results import Boxes, Results
 
 from api.detector_service import DetectorService
 from api.models import DetectionResponse
 
 
+def make_boxes(rows: list[list[float]]) -> Boxes:
+    """
+    Build real YOLO boxes from [x1, y1, x2, y2, conf, cls] rows.
+    """
+    data = torch.tensor(rows, dtype=torch.float32).reshape(-1, 6)
+    return Boxes(data, orig_shape=(480, 640))
+
+
 class TestDetectorService:
     """Test suite for DetectorService class."""
 
@@ -37,6 +48,7 @@ class TestDetectorService:
         return DetectorService(
             model_path="fake_model.pt",  # Path doesn't matter - model is mocked
             output_dir=temp_output_dir,
+            warmup_runs=0,  # Keep model call assertions focused on detect()
         )
 
     def test_service_initialization(self, detector_service, temp_output_dir):
@@ -47,30 +59,67 @@ class TestDetectorService:
         assert detector_service.output_dir.exists()
         assert detector_service.model is not None
 
-    def test_detect_returns_detection_response(self, detector_service, sample_image, mock_model):
+    def test_warmup_runs_dummy_inferences(self, mock_model, temp_output_dir):
+        """
+        Warm-up runs the requested number of inferences on a blank frame.
+        """
+        DetectorService(model_path="fake_model.pt", output_dir=temp_output_dir, warmup_runs=3)
+
+        assert mock_model.call_count == 3
+        dummy = mock_model.call_args.args[0]
+        assert dummy.shape == (640, 640, 3)
+        assert not dummy.any()
+
+    def test_warmup_and_detect_share_predictor_settings(
+        self, mock_model, temp_output_dir, sample_array
+    ):
+        """
+        Requests reuse the predictor set up by warm-up, under inference mode.
+        """
+        grad_enabled = []
+        mock_model.side_effect = lambda *args, **kwargs: (
+            grad_enabled.append(torch.is_grad_enabled()) or [Mock(boxes=make_boxes([]))]
+        )
+        service = DetectorService(
+            model_path="fake_model.pt", output_dir=temp_output_dir, warmup_runs=1
+        )
+        warmup_kwargs = mock_model.call_args.kwargs
+
+        service.detect(sample_array, save_annotated=False)
+        detect_kwargs = mock_model.call_args.kwargs
+
+        for key in ("half", "predictor"):
+            assert detect_kwargs[key] == warmup_kwargs[key]
+        assert grad_enabled == [False, False]
+
+    def test_warmup_failure_does_not_break_init(self, mock_model, temp_output_dir):
+        """
+        A failing warm-up is logged and the service still starts.
+        """
+        mock_model.side_effect = RuntimeError("boom")
+
+        service = DetectorService(
+            model_path="fake_model.pt", output_dir=temp_output_dir, warmup_runs=3
+        )
+
+        assert service.model is mock_model
+        assert mock_model.call_count == 1
+
+    def test_detect_returns_detection_response(self, detector_service, sample_array, mock_model):
         """
         Detect method returns proper response structure.
         """
         # Setup: Create fake YOLO results
         mock_result = Mock()
-        mock_box = Mock()
-
-        # Fake detection: person at [100, 100, 200, 200] with 0.95 confidence
-        # Note: xyxy[0] needs .tolist() method, so use Mock with return_value
-        mock_xyxy = Mock()
-        mock_xyxy.tolist.return_value = [100, 100, 200, 200]
-        mock_box.xyxy = [mock_xyxy]
-        mock_box.conf = [0.95]
-        mock_box.cls = [0]  # class_id 0 = 'person' from mock_instance.names
-
-        mock_result.boxes = [mock_box]
-        mock_result.boxes = [mock_box]
+
+        # Fake detection: person (class_id 0) at [100, 100, 200, 200] with 0.95 confidence
+        mock_result.boxes = make_boxes([[100, 100, 200, 200, 0.95, 0]])
         mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
 
         mock_model.return_value = [mock_result]
 
         # Execute: Run detection
-        response = detector_service.detect(sample_image, confidence_threshold=0.25)
+        response = detector_service.detect(sample_array, confidence_threshold=0.25)
 
         # Assert: Verify response structure
         assert isinstance(response, DetectionResponse)
@@ -80,41 +129,48 @@ class TestDetectorService:
         assert response.detections[0].box == [100, 100, 200, 200]
         assert response.summary == {"person": 1}
 
-    def test_detect_multiple_objects(self, detector_service, sample_image, mock_model):
+    def test_response_serializes_like_validated_model(
+        self, detector_service, sample_array, mock_model
+    ):
+        """
+        Unvalidated (model_construct) response dumps identically to a validated one.
+        """
+        mock_result = Mock()
+        mock_result.boxes = make_boxes([[100, 100, 200, 200, 0.95, 0]])
+        mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
+        mock_model.return_value = [mock_result]
+
+        response = detector_service.detect(sample_array, save_annotated=False)
+
+        assert (
+            response.model_dump()
+            == DetectionResponse.model_validate(response.model_dump()).model_dump()
+        )
+        assert response.model_dump()["detections"][0] == {
+            "box": [100, 100, 200, 200],
+            "label": "person",
+            "score": 0.95,
+        }
+
+    def test_detect_multiple_objects(self, detector_service, sample_array, mock_model):
         """
         Detect handles multiple objects correctly.
         """
         # Setup: 2 persons and 1 car
         mock_result = Mock()
 
-        mock_box1 = Mock()
-        mock_xyxy1 = Mock()
-        mock_xyxy1.tolist.return_value = [100, 100, 200, 200]
-        mock_box1.xyxy = [mock_xyxy1]
-        mock_box1.conf = [0.92]
-        mock_box1.cls = [0]  # person
-
-        mock_box2 = Mock()
-        mock_xyxy2 = Mock()
-        mock_xyxy2.tolist.return_value = [300, 150, 450, 250]
-        mock_box2.xyxy = [mock_xyxy2]
-        mock_box2.conf = [0.88]
-        mock_box2.cls = [1]  # car
-
-        mock_box3 = Mock()
-        mock_xyxy3 = Mock()
-        mock_xyxy3.tolist.return_value = [500, 300, 600, 400]
-        mock_box3.xyxy = [mock_xyxy3]
-        mock_box3.conf = [0.85]
-        mock_box3.cls = [0]  # person
-
-        mock_result.boxes = [mock_box1, mock_box2, mock_box3]
-        mock_result.boxes = [mock_box1, mock_box2, mock_box3]
+        mock_result.boxes = make_boxes(
+            [
+                [100, 100, 200, 200, 0.92, 0],  # person
+                [300, 150, 450, 250, 0.88, 1],  # car
+                [500, 300, 600, 400, 0.85, 0],  # person
+            ]
+        )
         mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
         mock_model.return_value = [mock_result]
 
         # Execute
-        response = detector_service.detect(sample_image)
+        response = detector_service.detect(sample_array)
 
         # Assert
         assert len(response.detections) == 3
@@ -125,68 +181,219 @@ class TestDetectorService:
         assert labels.count("person") == 2
         assert labels.count("car") == 1
 
-    def test_detect_no_objects(self, detector_service, sample_image, mock_model):
+    def test_detect_no_objects(self, detector_service, sample_array, mock_model):
         """
         Handle empty detections (no objects found).
         """
         # Setup: Empty detection
         mock_result = Mock()
-        mock_result.boxes = []  # No detections
-        mock_result.boxes = []  # No detections
+        mock_result.boxes = make_boxes([])  # No detections
         mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
         mock_model.return_value = [mock_result]
 
         # Execute
-        response = detector_service.detect(sample_image)
+        response = detector_service.detect(sample_array)
 
         # Assert
         assert len(response.detections) == 0
         assert response.summary == {}
 
-    @patch("api.detector_service.cv2.imwrite")
+    def test_annotated_image_is_stored_and_linked(self, detector_service, sample_array, mock_model):
+        """
+        Annotated JPEG is kept in the image store and the response links to it.
+        """
+        # Setup
+        mock_result = Mock()
+        mock_result.boxes = make_boxes([])
+        mock_result.plot = Mock(return_value=np.zeros((100, 120, 3), dtype=np.uint8))
+        mock_model.return_value = [mock_result]
+
+        # Execute
+        response = detector_service.detect(
+            sample_array, save_annotated=False, return_annotated=True
+        )
+
+        # Assert: URL points at the stored JPEG with the plotted image's dimensions
+        assert response.annotated_image == f"/detect/{response.request_id}/annotated.jpg"
+        jpeg_bytes = detector_service.image_store.get(response.request_id)
+        assert jpeg_bytes.startswith(b"\xff\xd8")
+        assert simplejpeg.decode_jpeg_header(jpeg_bytes)[:2] == (100, 120)
+
+    def test_inline_annotated_image_is_not_stored(self, detector_service, sample_array, mock_model):
+        """
+        An image returned inline is attached to the response and kept out of the store.
+        """
+        mock_result = Mock()
+        mock_result.boxes = make_boxes([])
+        mock_result.plot = Mock(return_value=np.zeros((100, 120, 3), dtype=np.uint8))
+        mock_model.return_value = [mock_result]
+        detector_service.image_store = Mock(wraps=detector_service.image_store)
+
+        (response,) = detector_service.detect_batch(
+            [sample_array],
+            [0.25],
+            save_annotated=False,
+            return_annotated=[True],
+            inline_annotated=[True],
+        )
+
+        assert simplejpeg.decode_jpeg_header(response.annotated_jpeg)[:2] == (100, 120)
+        assert response.request_id is None
+        assert response.annotated_image is None
+        detector_service.image_store.put.assert_not_called()
+
     def test_saves_annotated_image(
-        self, mock_imwrite, detector_service, sample_image, mock_model, temp_output_dir
+        self, detector_service, sample_array, mock_model, temp_output_dir
     ):
         """
         Verify annotated image is saved.
         """
         # Setup
         mock_result = Mock()
-        mock_result.boxes = []
-        mock_result.boxes = []
-        dummy_img = np.zeros((100, 100, 3), dtype=np.uint8)
-        mock_result.plot = Mock(return_value=dummy_img)
+        mock_result.boxes = make_boxes([])
+        mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
         mock_model.return_value = [mock_result]
 
         # Execute
-        detector_service.detect(sample_image, save_annotated=True)
+        detector_service.detect(sample_array, save_annotated=True)
+
+        # Assert: JPEG written to the expected path
+        output_path = temp_output_dir / "last_annotated.jpg"
+        assert output_path.exists()
+        assert simplejpeg.decode_jpeg_header(output_path.read_bytes())[:2] == (100, 100)
+
+    def test_saves_annotated_image_to_given_dir(
+        self, detector_service, sample_array, mock_model, tmp_path
+    ):
+        """
+        A per-call output_dir takes precedence over the service's directory.
+        """
+        mock_result = Mock()
+        mock_result.boxes = make_boxes([])
+        mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
+        mock_model.return_value = [mock_result]
+
+        detector_service.detect(sample_array, save_annotated=True, output_dir=tmp_path)
+
+        assert (tmp_path / "last_annotated.jpg").exists()
+        assert not (detector_service.output_dir / "last_annotated.jpg").exists()
+
+    def test_saved_and_returned_image_share_one_encode(
+        self, detector_service, sample_array, mock_model, temp_output_dir
+    ):
+        """
+        The saved file holds the same JPEG bytes as the stored response image.
+        """
+        mock_result = Mock()
+        mock_result.boxes = make_boxes([])
+        mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
+        mock_model.return_value = [mock_result]
+
+        response = detector_service.detect(sample_array, save_annotated=True, return_annotated=True)
+
+        saved = (temp_output_dir / "last_annotated.jpg").read_bytes()
+        assert detector_service.image_store.get(response.request_id) == saved
+
+    def test_plot_runs_once_for_save_and_return(self, detector_service, sample_array, mock_model):
+        """
+        Annotated image is drawn once and shared by the response and the saved file.
+        """
+        mock_result = Mock()
+        mock_result.boxes = make_boxes([])
+        mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
+        mock_model.return_value = [mock_result]
+
+        response = detector_service.detect(sample_array, save_annotated=True, return_annotated=True)
+
+        mock_result.plot.assert_called_once()
+        assert response.annotated_image is not None
+
+    def test_no_plot_when_annotation_unused(self, detector_service, sample_array, mock_model):
+        """
+        Skip drawing entirely when the image is neither saved nor returned.
+        """
+        mock_result = Mock()
+        mock_result.boxes = make_boxes([])
+        mock_result.plot = Mock()
+        mock_model.return_value = [mock_result]
 
-        # Assert: cv2.imwrite was called with correct path
-        expected_path = str(temp_output_dir / "last_annotated.jpg")
-        # Assert: cv2.imwrite was called with correct path
-        expected_path = str(temp_output_dir / "last_annotated.jpg")
-        # Check that imwrite was called with the path and our dummy image
-        mock_imwrite.assert_called_once()
-        assert mock_imwrite.call_args[0][0] == expected_path
-        # Use simple identity check or just assert called, since comparing numpy arrays in args can be tricky
-        # but here we passed the exact object
-        assert mock_imwrite.call_args[0][1] is dummy_img
+        response = detector_service.detect(sample_array, save_annotated=False)
 
-    def test_confidence_threshold_applied(self, detector_service, sample_image, mock_model):
+        mock_result.plot.assert_not_called()
+        assert response.annotated_image is None
+        assert response.request_id is None
+
+    def test_confidence_threshold_applied(self, detector_service, sample_array, mock_model):
         """
         Verify confidence threshold is passed to model.
         """
         # Setup
         mock_result = Mock()
-        mock_result.boxes = []
-        mock_result.boxes = []
+        mock_result.boxes = make_boxes([])
         mock_result.plot = Mock(return_value=np.zeros((100, 100, 3), dtype=np.uint8))
         mock_model.return_value = [mock_result]
 
         # Execute with custom threshold
-        detector_service.detect(sample_image, confidence_threshold=0.75)
+        detector_service.detect(sample_array, confidence_threshold=0.75)
 
         # Assert: Model called with correct confidence
         mock_model.assert_called_once()
         call_kwargs = mock_model.call_args[1]
         assert call_kwargs["conf"] == 0.75
+
+    def test_detect_batch_single_model_call(self, detector_service, sample_array, mock_model):
+        """
+        A batch is inferred with one model call at the lowest threshold,
+        then each result is filtered to its own threshold.
+        """
+        # Setup: Same two boxes (0.9 person, 0.4 car) for both images
+        boxes = torch.tensor([[10, 10, 50, 50, 0.9, 0], [60, 60, 90, 90, 0.4, 1]])
+        mock_model.return_value = [
+            Results(
+                orig_img=np.zeros((100, 100, 3), dtype=np.uint8),
+                path="",
+                names=mock_model.names,
+                boxes=boxes.clone(),
+            )
+            for _ in range(2)
+        ]
+
+        # Execute
+        responses = detector_service.detect_batch([sample_array, sample_array], [0.3, 0.5])
+
+        # Assert: One inference for the whole batch at the minimum threshold
+        mock_model.assert_called_once()
+        assert len(mock_model.call_args.args[0]) == 2
+        assert mock_model.call_args.kwargs["conf"] == 0.3
+
+        # Assert: Second image only keeps detections above its own threshold
+        assert responses[0].summary == {"person": 1, "car": 1}
+        assert responses[1].summary == {"person": 1}
+
+    def test_batch_saves_only_last_image_per_dir(
+        self, detector_service, sample_array, mock_model, temp_output_dir
+    ):
+        """
+        In a batch, only the image whose file would survive is drawn and saved.
+        """
+        plotted = []
+        mock_results = []
+        for i in range(3):
+            mock_result = Mock()
+            mock_result.boxes = make_boxes([])
+            frame = np.full((100, 100 + i, 3), i, dtype=np.uint8)
+            mock_result.plot = Mock(side_effect=lambda i=i, frame=frame: plotted.append(i) or frame)
+            mock_results.append(mock_result)
+        mock_model.return_value = mock_results
+
+        detector_service.detect_batch(
+            [sample_array] * 3,
+            [0.25] * 3,
+            save_annotated=True,
+            return_annotated=[True, False, False],
+        )
+
+        # First image is drawn only because it's returned; the second isn't drawn at all
+        assert plotted == [0, 2]
+        saved = (temp_output_dir / "last_annotated.jpg").read_bytes()
+        assert simplejpeg.decode_jpeg_header(saved)[:2] == (100, 102)
@@ -2,10 +2,13 @@
 End-to-End (E2E) test
 """
 
-import io
+import asyncio
 from pathlib import Path
 
+import httpx
+import numpy as np
 import pytest
+import simplejpeg
 from fastapi.testclient import TestClient
 from PIL import Image
 
@@ -13,35 +16,35 @@ from PIL import Image
 pytestmark = pytest.mark.e2e
 
 
-@pytest.fixture(scope="module")
-def test_image_path():
+def _collect_samples():
     """
-    Path to a real test image.
+    Sample images shipped in the repository's sample/ directory, if any.
     """
-    # Check if sample images exist
-    sample_dir = Path("sample")
-    if sample_dir.exists():
-        images = list(sample_dir.glob("*.png")) + list(sample_dir.glob("*.jpg"))
-        if images:
-            return images[0]
+    sample_dir = Path(__file__).parent.parent / "sample"
+    # Sorted so every pytest-xdist worker collects the same order
+    return sorted([*sample_dir.glob("*.png"), *sample_dir.glob("*.jpg")])
+
 
-    # Create a test image if no samples exist
-    test_dir = Path("tests/fixtures")
-    test_dir.mkdir(parents=True, exist_ok=True)
-    test_image = test_dir / "test_image.jpg"
+@pytest.fixture(scope="session")
+def test_image_path():
+    """
+    Path to the small real test image shipped with the tests.
+    """
+    return Path(__file__).parent / "fixtures" / "test_image.jpg"
 
-    if not test_image.exists():
-        # Create a simple test image with some shapes
-        img = Image.new("RGB", (640, 480), color="blue")
-        img.save(test_image)
 
-    return test_image
+@pytest.fixture(scope="session")
+def test_image_bytes(test_image_path):
+    """
+    Contents of the test image, read once per session.
+    """
+    return Path(test_image_path).read_bytes()
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
 def real_client():
     """
-    Real FastAPI client with actual model loaded.
+    Real FastAPI client with actual model loaded (once per session).
     """
     # Import here so model loads only when running E2E tests
     from api.main import app
@@ -49,30 +52,34 @@ def real_client():
     return TestClient(app)
 
 
+@pytest.fixture(scope="module")
+def _model_ready(real_client):
+    """
+    Check once per module that the app started and answers health checks.
+    """
+    response = real_client.get("/health")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+    return True
+
+
 class TestEndToEndDetection:
     """E2E tests for the complete detection pipeline."""
 
-    def test_model_loads_successfully(self, real_client):
+    def test_model_loads_successfully(self, _model_ready):
         """
         Verify the application starts and model loads.
         """
-        # Health check should work if app started successfully
-        response = real_client.get("/health")
-        assert response.status_code == 200
-        assert response.json() == {"status": "ok"}
+        assert _model_ready
 
-    def test_real_detection_with_actual_image(self, real_client, test_image_path):
+    def test_real_detection_with_actual_image(self, real_client, _model_ready, test_image_bytes):
         """
         Run real detection with actual YOLO model.
         """
-        # Load real image
-        with open(test_image_path, "rb") as f:
-            image_bytes = f.read()
-
         # Send real request
         response = real_client.post(
             "/detect",
-            files={"image": ("test.jpg", image_bytes, "image/jpeg")},
+            files={"image": ("test.jpg", test_image_bytes, "image/jpeg")},
             data={"confidence_threshold": "0.25"},
         )
 
@@ -95,103 +102,87 @@ class TestEndToEndDetection:
             assert 0.0 <= detection["score"] <= 1.0
             assert all(isinstance(x, int) for x in detection["box"])
 
-    def test_annotated_image_actually_saved(self, real_client, test_image_path, tmp_path):
+    def test_annotated_image_actually_saved(
+        self, real_client, _model_ready, test_image_bytes, tmp_path, monkeypatch
+    ):
         """
         Verify annotated image is actually written to disk.
         """
-        # Setup: Override output directory for this test
-        from api import config
+        # Setup: Override output directory for this test's requests only
+        from api.main import app, get_output_dir
 
-        original_output = config.OUTPUT_DIR
         test_output_dir = tmp_path / "output"
         test_output_dir.mkdir()
-        config.OUTPUT_DIR = test_output_dir
-
-        # Also update the detector's output directory
-        from api.main import detector
-
-        detector.output_dir = test_output_dir
+        monkeypatch.setitem(app.dependency_overrides, get_output_dir, lambda: test_output_dir)
 
-        try:
-            # Load and send real image
-            with open(test_image_path, "rb") as f:
-                image_bytes = f.read()
-
-            response = real_client.post(
-                "/detect",
-                files={"image": ("test.jpg", image_bytes, "image/jpeg")},
-                data={"confidence_threshold": "0.25"},
-            )
-
-            assert response.status_code == 200
+        # Send real image
+        response = real_client.post(
+            "/detect",
+            files={"image": ("test.jpg", test_image_bytes, "image/jpeg")},
+            data={"confidence_threshold": "0.25"},
+        )
 
-            # Assert: File was actually created
-            output_file = test_output_dir / "last_annotated.jpg"
-            assert output_file.exists(), "Annotated image was not saved!"
+        assert response.status_code == 200
 
-            # Assert: File is not empty
-            assert output_file.stat().st_size > 0, "Annotated image is empty!"
+        # Assert: File was actually created
+        output_file = test_output_dir / "last_annotated.jpg"
+        assert output_file.exists(), "Annotated image was not saved!"
 
-            # Assert: File is a valid image
-            img = Image.open(output_file)
-            assert img.format == "JPEG"
-            assert img.size[0] > 0 and img.size[1] > 0
+        # Assert: File is not empty
+        assert output_file.stat().st_size > 0, "Annotated image is empty!"
 
-        finally:
-            # Restore original config
-            config.OUTPUT_DIR = original_output
-            detector.output_dir = original_output
+        # Assert: File is a valid image
+        img = Image.open(output_file)
+        assert img.format == "JPEG"
+        assert img.size[0] > 0 and img.size[1] > 0
 
-    def test_different_confidence_thresholds(self, real_client, test_image_path):
+    def test_different_confidence_thresholds(self, real_client, _model_ready, test_image_bytes):
         """
         Verify confidence threshold actually affects results.
         """
-        with open(test_image_path, "rb") as f:
-            image_bytes = f.read()
-
         # Test with low threshold
         response_low = real_client.post(
             "/detect",
-            files={"image": ("test.jpg", image_bytes, "image/jpeg")},
+            files={"image": ("test.jpg", test_image_bytes, "image/jpeg")},
             data={"confidence_threshold": "0.1"},
         )
+        assert response_low.status_code == 200
+        low = response_low.json()
+        low_count = len(low["detections"])
 
-        # Reset file pointer
-        with open(test_image_path, "rb") as f:
-            image_bytes = f.read()
+        # Nothing at the low threshold means nothing at a higher one either,
+        # so the second inference could not change the outcome
+        if low_count == 0:
+            return
 
-        # Test with high threshold
+        # Test with high threshold (same bytes: they are immutable)
         response_high = real_client.post(
             "/detect",
-            files={"image": ("test.jpg", image_bytes, "image/jpeg")},
+            files={"image": ("test.jpg", test_image_bytes, "image/jpeg")},
             data={"confidence_threshold": "0.8"},
         )
-
-        assert response_low.status_code == 200
         assert response_high.status_code == 200
-
-        low_count = len(response_low.json()["detections"])
-        high_count = len(response_high.json()["detections"])
+        high = response_high.json()
+        high_count = len(high["detections"])
 
         # Lower threshold should detect >= higher threshold
-        # (might be equal if no objects detected or all high confidence)
+        # (might be equal if all detections are high confidence)
         assert low_count >= high_count, (
             f"Lower threshold ({low_count}) should detect >= higher threshold ({high_count})"
         )
 
-    def test_handles_image_with_no_objects(self, real_client):
+    def test_handles_image_with_no_objects(self, real_client, _model_ready):
         """
         Verify system handles images with no detections.
         """
         # Create a solid white image (unlikely to contain detectable objects)
-        blank_image = Image.new("RGB", (640, 480), color="white")
-        img_byte_arr = io.BytesIO()
-        blank_image.save(img_byte_arr, format="JPEG")
-        img_byte_arr.seek(0)
+        blank_bytes = simplejpeg.encode_jpeg(
+            np.full((480, 640, 3), 255, np.uint8), quality=85, colorspace="RGB"
+        )
 
         response = real_client.post(
             "/detect",
-            files={"image": ("blank.jpg", img_byte_arr.getvalue(), "image/jpeg")},
+            files={"image": ("blank.jpg", blank_bytes, "image/jpeg")},
             data={"confidence_threshold": "0.5"},
         )
 
@@ -202,57 +193,47 @@ class TestEndToEndDetection:
         assert json_data["detections"] == []
         assert json_data["summary"] == {}
 
-    @pytest.mark.skipif(not Path("sample").exists(), reason="Requires sample directory with images")
-    def test_real_sample_images(self, real_client):
+    @pytest.mark.parametrize("image_path", _collect_samples(), ids=lambda p: p.name)
+    def test_real_sample_images(self, real_client, _model_ready, image_path):
         """
-        Test with all available sample images.
+        Test with each available sample image.
         """
-        sample_dir = Path("sample")
-        images = list(sample_dir.glob("*.png")) + list(sample_dir.glob("*.jpg"))
-
-        assert len(images) > 0, "No sample images found!"
-
-        for image_path in images:
-            with open(image_path, "rb") as f:
-                image_bytes = f.read()
-
-            response = real_client.post(
-                "/detect",
-                files={"image": (image_path.name, image_bytes, "image/jpeg")},
-                data={"confidence_threshold": "0.25"},
-            )
+        response = real_client.post(
+            "/detect",
+            files={"image": (image_path.name, image_path.read_bytes(), "image/jpeg")},
+            data={"confidence_threshold": "0.25"},
+        )
 
-            assert response.status_code == 200, f"Failed to detect objects in {image_path.name}"
+        assert response.status_code == 200, f"Failed to detect objects in {image_path.name}"
 
-            json_data = response.json()
-            assert "detections" in json_data
-            assert "summary" in json_data
+        json_data = response.json()
+        assert "detections" in json_data
+        assert "summary" in json_data
 
 
 class TestModelPerformance:
     """E2E performance and load tests."""
 
-    def test_concurrent_requests_dont_crash(self, real_client, test_image_path):
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_dont_crash(self, test_image_bytes):
         """
         Verify async handling works with real model.
         """
-        import concurrent.futures
-
-        with open(test_image_path, "rb") as f:
-            image_bytes = f.read()
-
-        def make_request():
-            response = real_client.post(
-                "/detect",
-                files={"image": ("test.jpg", image_bytes, "image/jpeg")},
-                data={"confidence_threshold": "0.25"},
+        from api.main import app
+
+        # Requests share one event loop, so they exercise the async path and micro-batching
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(
+                *(
+                    client.post(
+                        "/detect",
+                        files={"image": ("test.jpg", test_image_bytes, "image/jpeg")},
+                        data={"confidence_threshold": "0.25"},
+                    )
+                    for _ in range(5)
+                )
             )
-            return response.status_code
-
-        # Send 5 concurrent requests
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            futures = [executor.submit(make_request) for _ in range(5)]
-            results = [f.result() for f in concurrent.futures.as_completed(futures)]
 
         # All requests should succeed
-        assert all(status == 200 for status in results), "Some concurrent requests failed!"
+        assert all(r.status_code == 200 for r in responses), "Some concurrent requests failed!"
@@ -0,0 +1,113 @@
+"""
+Unit tests for the annotated image stores.
+"""
+
+import os
+import time
+
+import pytest
+
+from api.image_store import AnnotatedImageStore, DirectoryImageStore, ImageStore
+
+
+class TestImageStore:
+    """Test suite for the abstract store base."""
+
+    def test_incomplete_store_cannot_be_created(self):
+        """
+        A store missing get() fails on construction, not on a live request.
+        """
+
+        class PutOnlyStore(ImageStore):
+            def put(self, jpeg_bytes: bytes) -> str:
+                return "id"
+
+        with pytest.raises(TypeError):
+            PutOnlyStore()
+
+
+class TestAnnotatedImageStore:
+    """Test suite for the in-memory store."""
+
+    def test_put_and_get(self):
+        """
+        Stored bytes are returned by id and linked by the annotated image route.
+        """
+        store = AnnotatedImageStore()
+
+        request_id = store.put(b"jpeg")
+
+        assert store.get(request_id) == b"jpeg"
+        assert store.url_for(request_id) == f"/detect/{request_id}/annotated.jpg"
+
+    def test_expired_entries_are_gone(self):
+        """
+        Entries are not returned after their TTL.
+        """
+        store = AnnotatedImageStore(ttl_seconds=-1)
+
+        assert store.get(store.put(b"jpeg")) is None
+
+    def test_oldest_entries_evicted_at_capacity(self):
+        """
+        Memory stays bounded: the oldest entry is dropped when the store is full.
+        """
+        store = AnnotatedImageStore(max_entries=2)
+
+        first, second, third = (store.put(bytes([i])) for i in range(3))
+
+        assert store.get(first) is None
+        assert store.get(second) == b"\x01"
+        assert store.get(third) == b"\x02"
+
+
+class TestDirectoryImageStore:
+    """Test suite for the file-backed store used with several workers."""
+
+    def test_shared_between_instances(self, tmp_path):
+        """
+        An image stored by one worker's store is served by another's.
+        """
+        request_id = DirectoryImageStore(tmp_path).put(b"jpeg")
+
+        assert DirectoryImageStore(tmp_path).get(request_id) == b"jpeg"
+
+    def test_expired_files_ignored_and_swept(self, tmp_path):
+        """
+        Expired files are not served and are removed on a later put.
+        """
+        store = DirectoryImageStore(tmp_path, ttl_seconds=60)
+        old_id = store.put(b"old")
+        stale = time.time() - 120
+        os.utime(tmp_path / f"{old_id}.jpg", (stale, stale))
+
+        assert store.get(old_id) is None
+
+        store.put(b"new")
+        assert not (tmp_path / f"{old_id}.jpg").exists()
+
+    def test_oldest_files_evicted_at_capacity(self, tmp_path):
+        """
+        Disk use stays bounded: the oldest file goes once the directory is full.
+        """
+        store = DirectoryImageStore(tmp_path, max_entries=2)
+        first = store.put(b"first")
+        stale = time.time() - 30  # Older, but still within the TTL
+        os.utime(tmp_path / f"{first}.jpg", (stale, stale))
+
+        second, third = store.put(b"second"), store.put(b"third")
+
+        assert store.get(first) is None
+        assert store.get(second) == b"second"
+        assert store.get(third) == b"third"
+        assert len(list(tmp_path.glob("*.jpg"))) == 2
+
+    def test_rejects_ids_it_could_not_have_generated(self, tmp_path):
+        """
+        Ids come from the URL, so anything but a generated id is refused.
+        """
+        (tmp_path.parent / "secret.jpg").write_bytes(b"secret")
+        store = DirectoryImageStore(tmp_path)
+
+        assert store.get("../secret") is None
+        assert store.get("unknown") is None
@@ -0,0 +1,76 @@
+"""
+Unit tests for the on-device preprocessing predictor.
+"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+from ultralytics.models.yolo.detect import DetectionPredictor
+
+from api.predictor import DevicePreprocessPredictor
+
+
+class TestDevicePreprocessPredictor:
+    """Test suite for DevicePreprocessPredictor.preprocess against the stock predictor."""
+
+    @pytest.fixture
+    def make_predictor(self):
+        """
+        Build a predictor wired to a stub PyTorch model on the given device.
+        """
+
+        def make(cls, device):
+            predictor = cls(overrides={"rect": True, "imgsz": 640})
+            predictor.model = SimpleNamespace(pt=True, stride=32, fp16=False)
+            predictor.device = torch.device(device)
+            predictor.imgsz = (640, 640)
+            return predictor
+
+        return make
+
+    @pytest.mark.parametrize(
+        "device",
+        [
+            "cpu",
+            pytest.param(
+                "cuda",
+                marks=pytest.mark.skipif(not torch.cuda.is_available(), reason="needs CUDA"),
+            ),
+        ],
+    )
+    def test_matches_stock_preprocess(self, make_predictor, device):
+        """
+        Batches match the stock preprocessing, including across reused buffers.
+        """
+        rng = np.random.default_rng(0)
+        stock = make_predictor(DetectionPredictor, "cpu")
+        predictor = make_predictor(DevicePreprocessPredictor, device)
+
+        # Second call reuses the staging/batch buffers with different frames
+        for shape, count in (((480, 640), 2), ((1000, 700), 3)):
+            frames = [rng.integers(0, 256, (*shape, 3), dtype=np.uint8) for _ in range(count)]
+
+            expected = stock.preprocess(frames)
+            result = predictor.preprocess(frames).float().cpu()
+
+            assert result.shape == expected.shape
+            assert (result - expected).abs().max() <= 1.5 / 255
+
+    @pytest.mark.skipif(not torch.cuda.is_available(), reason="needs CUDA")
+    def test_pinned_buffer_is_capped(self, make_predictor):
+        """
+        Frames past the pinned memory cap still upload, without growing the buffer.
+        """
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 256, (480, 640, 3), dtype=np.uint8) for _ in range(3)]
+        stock = make_predictor(DetectionPredictor, "cpu")
+        predictor = make_predictor(DevicePreprocessPredictor, "cuda")
+        predictor.pinned_max_bytes = frames[0].nbytes + 1  # Room for one frame only
+
+        expected = stock.preprocess(frames)
+        result = predictor.preprocess(frames).float().cpu()
+
+        assert predictor._pinned.numel() <= predictor.pinned_max_bytes
+        assert (result - expected).abs().max() <= 1.5 / 255
@@ -0,0 +1,76 @@
+"""
+Unit tests for the letterbox implementations (Numba CPU kernel and torch).
+"""
+
+import numpy as np
+import pytest
+import torch
+from ultralytics.data.augment import LetterBox
+
+from api.predictor import letterbox_tensor
+from api.preprocess import letterbox_chw, letterbox_params
+
+
+def run_letterbox_chw(img: np.ndarray, auto: bool) -> np.ndarray:
+    """
+    Letterbox with the Numba kernel into a NaN-filled buffer, so unwritten pixels show.
+    """
+    (unpad_h, unpad_w), (top, bottom, left, right) = letterbox_params(
+        img.shape[:2], (640, 640), auto, 32
+    )
+    out = np.full((3, unpad_h + top + bottom, unpad_w + left + right), np.nan, np.float32)
+    letterbox_chw(img, out, unpad_h, unpad_w, top, left)
+    return out
+
+
+def run_letterbox_tensor(img: np.ndarray, auto: bool) -> np.ndarray:
+    """
+    Letterbox with the torch implementation used on CUDA (run here on CPU).
+    """
+    return letterbox_tensor(torch.from_numpy(img), (640, 640), auto, 32).numpy()
+
+
+@pytest.mark.parametrize(
+    "letterbox", [run_letterbox_chw, run_letterbox_tensor], ids=["numba", "torch"]
+)
+class TestLetterbox:
+    """Test suite for both letterbox implementations, compared against Ultralytics' LetterBox."""
+
+    @pytest.mark.parametrize(
+        ("shape", "auto"),
+        [
+            ((480, 640), True),  # Rect inference, already at target width
+            ((1000, 700), True),  # Downscale with minimal stride padding
+            ((1000, 700), False),  # Downscale to full square
+            ((200, 300), False),  # Upscale
+        ],
+    )
+    def test_matches_ultralytics_letterbox(self, letterbox, shape, auto):
+        """
+        Output matches the stock CPU letterbox up to uint8 rounding.
+        """
+        rng = np.random.default_rng(0)
+        img = rng.integers(0, 256, (*shape, 3), dtype=np.uint8)
+
+        # Reference: Ultralytics letterbox + BGR->RGB + HWC->CHW + /255
+        expected = LetterBox((640, 640), auto=auto, stride=32)(image=img)
+        expected = expected[..., ::-1].transpose(2, 0, 1) / 255
+
+        result = letterbox(img, auto)
+
+        assert result.shape == expected.shape
+        assert result.dtype == np.float32
+        assert np.abs(result - expected).max() <= 1.5 / 255
+
+    @pytest.mark.parametrize("shape", [(1, 3000), (3000, 1)])
+    def test_extreme_aspect_ratio(self, letterbox, shape):
+        """
+        A side that would round to zero pixels keeps one, instead of failing.
+        """
+        img = np.full((*shape, 3), 200, dtype=np.uint8)
+
+        result = letterbox(img, True)
+
+        assert min(letterbox_params(shape, (640, 640), True, 32)[0]) == 1
+        assert np.isfinite(result).all()
+        assert np.isclose(result.max(), 200 / 255)
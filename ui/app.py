@@ -2,16 +2,41 @@
 YOLOv8 Object Detection UI - Single Column Layout
 """
 
-import base64
+import json
 import os
-from io import BytesIO
+from urllib.parse import urljoin
 
+import numpy as np
+import pandas as pd
 import requests
 import streamlit as st
 from PIL import Image
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.decoder import MultipartDecoder
+from requests_toolbelt.multipart.encoder import MultipartEncoder
 
 st.set_page_config(page_title="Object Detection", layout="centered")
 
+
+@st.cache_resource
+def _session() -> requests.Session:
+    """HTTP session shared across reruns so API connections are kept alive."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+@st.cache_data(ttl=10)
+def _probe(url: str) -> int | None:
+    """Health check status code (None if unreachable), reused across reruns for 10s."""
+    try:
+        return _session().get(url, timeout=3).status_code
+    except requests.exceptions.RequestException:
+        return None
+
+
 # Header
 st.title("Object Detection")
 
@@ -19,6 +44,7 @@ st.title("Object Detection")
 with st.sidebar:
     st.header("Settings")
     confidence = st.slider("Confidence Threshold", 0.0, 1.0, 0.25, 0.05)
+    imgsz = st.select_slider("Inference Size", options=[320, 416, 512, 640], value=640)
 
     st.divider()
 
@@ -26,46 +52,82 @@ with st.sidebar:
     API_URL = os.getenv("API_URL", "http://api:8000/detect")
     HEALTH_URL = API_URL.replace("/detect", "/health")
 
-    try:
-        if requests.get(HEALTH_URL, timeout=3).status_code == 200:
-            st.success("API Connected")
-        else:
-            st.warning("API Issue")
-    except requests.exceptions.RequestException:
+    status = _probe(HEALTH_URL)
+    if status == 200:
+        st.success("API Connected")
+    elif status is not None:
+        st.warning("API Issue")
+    else:
         st.error("API Offline")
 
 # File upload
 uploaded_file = st.file_uploader("Upload an image", type=["jpg", "jpeg", "png"])
 
 if uploaded_file:
-    # Show uploaded image (smaller preview)
+    # Show uploaded image (smaller preview). Shrinking before st.image means only a
+    # 400px image is re-encoded for the browser; thumbnail() also lets JPEGs decode
+    # at reduced size instead of decoding every pixel first
     image = Image.open(uploaded_file)
+    image.thumbnail((400, 400), Image.Resampling.BILINEAR)
     st.image(image, caption="Uploaded Image", width=400)
 
     # Detect button
     if st.button("Detect Objects", type="primary"):
         with st.spinner("Detecting..."):
             try:
+                # Stream the multipart body from the file object in chunks; requests'
+                # files= would build the whole body in memory before sending
                 uploaded_file.seek(0)
-                files = {"image": (uploaded_file.name, uploaded_file.getvalue(), "image/jpeg")}
-                data = {"confidence_threshold": str(confidence)}
-
-                response = requests.post(API_URL, files=files, data=data, timeout=60)
+                encoder = MultipartEncoder(
+                    fields={
+                        "image": (uploaded_file.name, uploaded_file, "image/jpeg"),
+                        "confidence_threshold": str(confidence),
+                        "return_annotated": "true",
+                        "imgsz": str(imgsz),
+                    }
+                )
+
+                response = _session().post(
+                    API_URL,
+                    data=encoder,
+                    headers={
+                        "Content-Type": encoder.content_type,
+                        "Accept": "multipart/mixed, application/json",
+                    },
+                    timeout=60,
+                )
 
                 if response.status_code == 200:
-                    result = response.json()
+                    # JSON result and raw annotated JPEG arrive together, no second request
+                    annotated_jpeg = None
+                    if response.headers.get("Content-Type", "").startswith("multipart/mixed"):
+                        json_part, image_part = MultipartDecoder.from_response(response).parts
+                        result = json.loads(json_part.content)
+                        annotated_jpeg = image_part.content
+                    else:
+                        result = response.json()
+                        # JSON-only reply: the image is stored server-side, fetch it by URL
+                        annotated_url = result.get("annotated_image")
+                        if annotated_url:
+                            img_response = _session().get(
+                                urljoin(API_URL, annotated_url), timeout=10
+                            )
+                            if img_response.status_code == 200:
+                                annotated_jpeg = img_response.content
                     detections = result.get("detections", [])
                     summary = result.get("summary", {})
-                    annotated_b64 = result.get("annotated_image")
 
                     st.divider()
 
                     # Annotated image (full width)
-                    if annotated_b64:
-                        img_bytes = base64.b64decode(annotated_b64)
-                        annotated_img = Image.open(BytesIO(img_bytes))
+                    if annotated_jpeg:
+                        # Passed to st.image undecoded (an array would be re-encoded),
+                        # with the format given so it isn't sniffed
                         st.image(
-                            annotated_img, caption="Detection Results", use_container_width=True
+                            annotated_jpeg,
+                            caption="Detection Results",
+                            use_container_width=True,
+                            output_format="JPEG",
                         )
 
                     # Summary metrics
@@ -81,15 +143,29 @@ if uploaded_file:
                     # Details (expandable)
                     if detections:
                         with st.expander("View Details"):
+                            # Built column by column so Arrow gets each column's dtype in one
+                            # pass instead of inferring it from a list of per-row dicts
+                            count = len(detections)
+                            labels = np.fromiter(
+                                (d["label"] for d in detections), dtype=object, count=count
+                            )
+                            scores = np.fromiter(
+                                (d["score"] for d in detections), dtype=np.float32, count=count
+                            )
+                            table = pd.DataFrame(
+                                {
+                                    "Label": np.char.capitalize(labels.astype(str)),
+                                    "Confidence": scores * 100,
+                                    "Box": [str(d["box"]) for d in detections],
+                                }
+                            )
                             st.dataframe(
-                                [
-                                    {
-                                        "Label": d["label"].capitalize(),
-                                        "Confidence": f"{d['score']:.0%}",
-                                        "Box": str(d["box"]),
-                                    }
-                                    for d in detections
-                                ],
+                                table,
+                                column_config={
+                                    "Confidence": st.column_config.ProgressColumn(
+                                        format="%.0f%%", min_value=0, max_value=100
+                                    )
+                                },
                                 use_container_width=True,
                                 hide_index=True,
                             )